@@ -10,62 +10,210 @@
 """
 
 import argparse
+import array
+import concurrent.futures
+import functools
+import io
+import itertools
+import mmap
 from Bio import SeqIO
-import statistics
-import re
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+import numpy as np
 import os
 
+# pyfastx is an optional C extension (built on kseq.h) that reads FASTA files
+# much faster than Biopython, the Biopython parsers are used when it is missing
+try:
+    import pyfastx
+except ImportError:
+    pyfastx = None
+
 statistics_help_message = "If true prints file statistics"
+workers_help_message = "The number of worker processes used to convert the file, by default 1"
+# Buffer size for reading and writing files, larger buffers mean fewer system calls
+buffer_size = 1 << 20
+# Number of records formatted in memory before they are written to the genbank file
+write_batch_size = 10000
+# Standard FASTA file extensions
+fasta_extensions = frozenset(('.fasta', '.fa', '.fna', '.ffn', '.faa', '.frn'))
+# Lookup table of the bytes that are not counted as part of a sequence
+sequence_whitespace = np.zeros(256, dtype=bool)
+sequence_whitespace[list(b' \t\r\n')] = True
+
+
+def scan_lengths(fasta_file):
+
+    """
+    This function yields the length of every read in a FASTA file without parsing it.
+
+    The file is memory mapped and the header lines are found with byte searches,
+    the length of a read is the size of the block between two headers minus the
+    line breaks and other whitespace in it, which numpy counts on a zero copy view.
+
+    Parameters:
+        fasta_file (str): The path to the FASTA file to scan
+
+    Yields:
+        int: the length of each read
+    """
+
+    with open(fasta_file, 'rb') as handle:
+        # An empty file cannot be mapped and has no reads
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            try:
+                # Find the first header, anything before it is not part of a read
+                if mapped[:1] == b'>':
+                    header = 0
+                else:
+                    header = mapped.find(b'\n>')
+                    if header == -1:
+                        return
+                    header += 1
+                while True:
+                    line_end = mapped.find(b'\n', header)
+                    if line_end == -1:
+                        # A header on the last line has no sequence
+                        yield 0
+                        return
+                    next_header = mapped.find(b'\n>', line_end)
+                    block_end = len(mapped) if next_header == -1 else next_header
+                    # The block starts at the header's line break so it is never negative
+                    whitespace = np.count_nonzero(sequence_whitespace[data[line_end:block_end]])
+                    yield block_end - line_end - int(whitespace)
+                    if next_header == -1:
+                        return
+                    header = next_header + 1
+            finally:
+                # The map cannot be closed while numpy still holds a view of it
+                del data
+
+
+def read_lengths(records):
+
+    """
+    This function yields the length of every read, one at a time.
+
+    Parameters:
+        records (list or str): already parsed SeqRecord objects, or the name of
+            a FASTA file which is then read here
+
+    Yields:
+        int: the length of each read
+    """
 
+    if isinstance(records, str):
+        # Only the lengths are needed, so scan the file instead of parsing it
+        yield from scan_lengths(records)
+    else:
+        for record in records:
+            yield len(record.seq)
+
+
+def middle_value(sizes):
+
+    """
+    This function calculates the median of an array of read lengths.
 
-def print_fasta_statistics(fasta_file): 
+    The array is partitioned in place around its middle, which takes linear time
+    and, unlike np.median, does not copy the array first. The order of the
+    array is changed.
+
+    Parameters:
+        sizes (numpy.ndarray): a writable array of read lengths
+
+    Returns:
+        float: the median read length
+    """
+
+    middle = len(sizes) // 2
+    if len(sizes) % 2:
+        sizes.partition(middle)
+        return float(sizes[middle])
+    # For an even number of reads the median is the mean of the two middle values
+    sizes.partition((middle - 1, middle))
+    return (int(sizes[middle - 1]) + int(sizes[middle])) / 2
+
+
+def print_fasta_statistics(records, median=True): 
 
     """ 
     This function calculates and prints the following statistics to the command line:
         Mean read length, Median read length, Maximum read length and Minimum read length.
 
     Parameters:
-        filename (str): The name of the file to check
+        records (list or str): already parsed SeqRecord objects, or the name of
+            a FASTA file which is then parsed here
+        median (bool): if False the median is skipped, so the read lengths
+            do not have to be kept in memory
 
     Returns:
         statisticsdictionary (dictionary): contains the calculated statistics
     """
 
-    # Load all records from your FASTA file into a list
-    records = list(SeqIO.parse(fasta_file, "fasta"))
+    # Keep running totals in a single pass rather than storing every size,
+    # the sizes are only kept when they are needed for the median
+    total_reads = 0
+    total_length = 0
+    max_length = 0
+    min_length = None
+    # When the number of reads is already known the typed array is sized up
+    # front, so it is filled in place instead of being grown and copied
+    preallocated = median and isinstance(records, (list, tuple))
+    if preallocated:
+        sizes = array.array('q', [0]) * len(records)
+    else:
+        sizes = array.array('q') if median else None
+    for length in read_lengths(records):
+        if preallocated:
+            sizes[total_reads] = length
+        elif median:
+            sizes.append(length)
+        total_reads += 1
+        total_length += length
+        if length > max_length:
+            max_length = length
+        if min_length is None or length < min_length:
+            min_length = length
 
     # Calculate total number of reads
-    total_reads = len(records)
     print(f"Total reads: {total_reads}")
 
-    # Calculate sizes of all reads
-    sizes = [len(record.seq) for record in records]
-
-    # Calculate and print various statistics
-    print(f"Mean read length: {statistics.mean(sizes)}")
-    print(f"Median read length: {statistics.median(sizes)}")
-    print(f"Max read length: {max(sizes)}")
-    print(f"Min read length: {min(sizes)}")
-    statisticsdictionary = {'total_reads': total_reads, 'mean_read_length': statistics.mean(sizes),'median_read_length': statistics.median(sizes), 'max_read_length': max(sizes), 'min_read_length': min(sizes)}
+    # Calculate the remaining statistics from the running totals
+    mean_length = total_length / total_reads
+    median_length = middle_value(np.frombuffer(sizes, dtype=np.int64)) if median else None
+
+    # Print the various statistics
+    print(f"Mean read length: {mean_length}")
+    if median:
+        print(f"Median read length: {median_length}")
+    print(f"Max read length: {max_length}")
+    print(f"Min read length: {min_length}")
+    statisticsdictionary = {'total_reads': total_reads, 'mean_read_length': mean_length,'median_read_length': median_length, 'max_read_length': max_length, 'min_read_length': min_length}
     return statisticsdictionary
 
 
 
 # Function to check the file extension
+@functools.lru_cache(maxsize=1024)
 def is_fasta(filename):
 
     """ 
     This function checks if the file is a FASTA file based on its extension. 
-    It returns true if the extension of the file filename is either .fasta or .fa.
+    It returns true if the extension of the file filename is one of the standard
+    FASTA extensions (.fasta, .fa, .fna, .ffn, .faa or .frn), in any case.
 
     Parameters:
         filename (str): The name of the file to check
 
     Returns:
-        bool: True if the file has a .fasta or a .fa extension, False otherwise
+        bool: True if the file has a FASTA extension, False otherwise
     """
 
-    return filename.endswith('.fasta') or filename.endswith('.fa')
+    return os.path.splitext(filename)[1].lower() in fasta_extensions
 
 # Function to check the FASTA header
 def has_valid_header(filename):
@@ -73,7 +221,7 @@ def has_valid_header(filename):
     """
     Check if a FASTA file has a valid header.
 
-    The function reads the first line of the file and checks if it starts with '>',
+    The function reads the first byte of the file and checks if it is '>',
     which is the standard header prefix in FASTA format.
 
     Parameters:
@@ -83,10 +231,18 @@ def has_valid_header(filename):
     bool: True if the file has a valid FASTA header, False otherwise.
     """
 
-    with open(filename, 'r') as file:
-        first_line = file.readline()
-        # A typical FASTA header starts with '>'
-        return bool(re.match(r'^>', first_line))
+    # The file's modification time and size are part of the cache key,
+    # so the cached answer is dropped as soon as the file changes
+    file_stat = os.stat(filename)
+    return _has_valid_header(filename, file_stat.st_mtime_ns, file_stat.st_size)
+
+@functools.lru_cache(maxsize=1024)
+def _has_valid_header(filename, mtime_ns, size):
+    # Cached helper for has_valid_header, mtime_ns and size are only used as cache keys
+    # Unbuffered, so exactly one byte is read however large the file is
+    with open(filename, 'rb', buffering=0) as file:
+        # A typical FASTA header starts with '>', so only the first byte is needed
+        return file.read(1) == b'>'
 
 
 
@@ -95,22 +251,36 @@ def parse_file(fasta_file):
     Parse a FASTA file and annotate each sequence with its molecule type (DNA).
 
     This function reads a FASTA file, parses each sequence into a SeqRecord object,
-    and adds an annotation indicating the molecule type as 'DNA'. A list of
-    annotated SeqRecord objects is then returned.
+    and adds an annotation indicating the molecule type as 'DNA'. The annotated
+    SeqRecord objects are yielded one at a time, so the whole file is never
+    held in memory.
 
     Parameters:
     fasta_file (str): The path to the FASTA file to be parsed.
 
-    Returns:
-    list: A list of SeqRecord objects with 'molecule_type' annotations.
+    Yields:
+    SeqRecord: A SeqRecord object with a 'molecule_type' annotation.
     """
 
-    # Parse the fasta file into a list
-    sequences = list(SeqIO.parse(fasta_file, "fasta"))
-    # Add the molecule_type annotation necessary for SeqIO.write
-    for sequence in sequences:
-        sequence.annotations["molecule_type"] = "DNA"
-    return(sequences)
+    # Bind the annotation key and value once, outside the per record loops
+    molecule_type = "molecule_type"
+    dna = "DNA"
+
+    if pyfastx is not None:
+        # Build the SeqRecords from the faster pyfastx reader, matching the
+        # id, name and description that SeqIO.parse would give
+        for name, sequence, comment in pyfastx.Fastx(fasta_file, comment=True):
+            description = f"{name} {comment}" if comment else name
+            yield SeqRecord(Seq(sequence), id=name, name=name, description=description,
+                            annotations={molecule_type: dna})
+        return
+
+    # Parse the fasta file one record at a time
+    with open(fasta_file, "r", buffering=buffer_size) as handle:
+        for sequence in SeqIO.parse(handle, "fasta"):
+            # Add the molecule_type annotation necessary for SeqIO.write
+            sequence.annotations[molecule_type] = dna
+            yield sequence
 
 def write_genbank(parsed_list, genbank_file="genbankOutput"):   
     
@@ -119,28 +289,133 @@ def write_genbank(parsed_list, genbank_file="genbankOutput"):
     It will create a genbank file at that path.
 
     Parameters:
-        parsed_list (list): parsed list object
+        parsed_list (iterable): parsed SeqRecord objects, a list or a generator
         genbank_file (str): output path 
     Returns:
         genbank file generated from the parsed list
     """
     output = None
+    # SeqIO.write accepts a single SeqRecord as well as an iterable of them
+    if isinstance(parsed_list, SeqRecord):
+        parsed_list = [parsed_list]
+    records = iter(parsed_list)
     ## Write the genbank file
     try:
-        output = SeqIO.write(parsed_list, genbank_file, "genbank")
+        with open(genbank_file, "w", buffering=buffer_size) as handle:
+            output = 0
+            # Format batches of records in memory and write each batch with a
+            # single call, rather than the many small writes SeqIO.write makes
+            while True:
+                batch = list(itertools.islice(records, write_batch_size))
+                if not batch:
+                    break
+                buffer = io.StringIO()
+                output += SeqIO.write(batch, buffer, "genbank")
+                handle.write(buffer.getvalue())
     except IOError as error:
         print(f"An I/O error occurred: {error}")
-        raise IOError("An I/O error occurred:  ")
-        return error
+        # Re-raise the original error so its message and traceback are kept
+        raise
     except Exception as error:
         print(f"An unexpected error occurred: {error}")
-        raise Exception
-        return error
+        raise
     else:
         print("Conversion process completed Successfully.")
         return output
 
 
+def split_fasta(fasta_file, parts):
+
+    """
+    This function splits a FASTA file into byte ranges that each start at a header.
+
+    The file is memory mapped and each split point is moved forward to the
+    next header line, so no record is divided between two ranges.
+
+    Parameters:
+        fasta_file (str): The path to the FASTA file to split
+        parts (int): The number of ranges to aim for
+
+    Returns:
+        list: (start, end) byte offsets of each range, in file order
+    """
+
+    with open(fasta_file, 'rb') as handle:
+        size = os.fstat(handle.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            boundaries = [0]
+            for part in range(1, parts):
+                split_point = mapped.find(b'\n>', max(part * size // parts, boundaries[-1]))
+                if split_point == -1:
+                    break
+                boundaries.append(split_point + 1)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def annotate_dna(record):
+    # Add the molecule_type annotation necessary for SeqIO.write
+    record.annotations["molecule_type"] = "DNA"
+    return record
+
+
+def convert_range(fasta_file, start, end):
+
+    """
+    This function converts one byte range of a FASTA file to GenBank text.
+    It is run in the worker processes of write_genbank_parallel.
+
+    Parameters:
+        fasta_file (str): The path to the FASTA file
+        start (int): The offset of the first byte of the range
+        end (int): The offset after the last byte of the range
+
+    Returns:
+        tuple: the GenBank text and the number of records it holds
+    """
+
+    with open(fasta_file, 'rb') as handle:
+        handle.seek(start)
+        text = handle.read(end - start).decode()
+    records = SeqIO.parse(io.StringIO(text), "fasta")
+    output = io.StringIO()
+    count = SeqIO.write((annotate_dna(record) for record in records), output, "genbank")
+    return output.getvalue(), count
+
+
+def write_genbank_parallel(fasta_file, genbank_file="genbankOutput", workers=None):
+
+    """
+    This function converts a FASTA file to a GenBank file using a pool of worker processes.
+    The file is split into ranges of whole records, each worker parses and formats
+    its ranges and the results are written to the GenBank file in the original order.
+
+    Parameters:
+        fasta_file (str): The path to the FASTA file
+        genbank_file (str): output path
+        workers (int): The number of worker processes, by default one per CPU
+    Returns:
+        the number of records written to the genbank file
+    """
+
+    workers = workers or os.cpu_count() or 1
+    # Use several ranges per worker so the finished ranges can be written
+    # while the others are still being converted
+    ranges = split_fasta(fasta_file, workers * 4)
+    output = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(convert_range, [fasta_file] * len(ranges),
+                               [start for start, _ in ranges], [end for _, end in ranges])
+        with open(genbank_file, "w", buffering=buffer_size) as handle:
+            for text, count in results:
+                handle.write(text)
+                output += count
+    print("Conversion process completed Successfully.")
+    return output
+
+
 def main():
 
     # This creates a parser object
@@ -151,15 +426,21 @@ def main():
     parser.add_argument("-i", "--input", help="The input fasta file", type=str, required=True)
     parser.add_argument("-o", "--output", help="The output genbank file", type=str, required=False)
     parser.add_argument("-p", "--print_stats", help=statistics_help_message, action='store_true', required=False)
+    parser.add_argument("-w", "--workers", help=workers_help_message, type=int, default=1, required=False)
 
     # Parse the arguments
     args = parser.parse_args()
 
     if is_fasta(args.input) and has_valid_header(args.input):
         print(f"{args.input} is a valid FASTA file.")
+        # The statistics only need the read lengths, so the file is scanned for
+        # them and the records are streamed straight to the output
         if args.print_stats is True:
             print(print_fasta_statistics(args.input))
-        write_genbank(parse_file(args.input), args.output)
+        if args.workers > 1:
+            write_genbank_parallel(args.input, args.output, args.workers)
+        else:
+            write_genbank(parse_file(args.input), args.output)
     else:
         print(f"{args.input} is not a valid FASTA file.")
     pass
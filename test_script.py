@@ -1,12 +1,14 @@
 import unittest
 import os
+import numpy as np
+import fastaTogenbank
 from Bio import SeqIO
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 from fastaTogenbank import parse_file
-from fastaTogenbank import write_genbank
+from fastaTogenbank import write_genbank, write_genbank_parallel
 from fastaTogenbank import has_valid_header, is_fasta
-from fastaTogenbank import print_fasta_statistics
+from fastaTogenbank import print_fasta_statistics, middle_value
 # These tests can be run as python -m unittest test_script.py -v
 
 
@@ -68,6 +70,17 @@ class TestWriteGenbank(unittest.TestCase):
             self.assertIn("seq1", content)
             self.assertIn("seq2", content)
             self.assertIn("seq3", content)
+    def test_write_genbank_in_batches(self):
+        # Test if every record is written when they are split over several batches
+        batch_size = fastaTogenbank.write_batch_size
+        fastaTogenbank.write_batch_size = 2
+        try:
+            count = write_genbank(self.parsed_list, self.genbank_file)
+        finally:
+            fastaTogenbank.write_batch_size = batch_size
+        self.assertEqual(count, 3)
+        with open(self.genbank_file, 'r') as file:
+            self.assertEqual(file.read().count("LOCUS"), 3)
     def test_write_genbank_ioerror(self):
         with self.assertRaises(IOError):
             write_genbank(self.parsed_list, "/invalid/path/output.gb")
@@ -77,6 +90,30 @@ class TestWriteGenbank(unittest.TestCase):
 
 
 
+class TestWriteGenbankParallel(unittest.TestCase):
+    def setUp(self):
+        self.test_fasta = "test.fasta"
+        with open(self.test_fasta, 'w') as file:
+            for number in range(20):
+                file.write(f">seq{number} sequence {number}\nATGCTAGCTA\nGCTACGATCG\n")
+        self.genbank_file = "test_output.gb"
+        self.parallel_genbank_file = "test_parallel_output.gb"
+
+    def tearDown(self):
+        # Remove the temporary files after tests
+        for filename in (self.test_fasta, self.genbank_file, self.parallel_genbank_file):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_write_genbank_parallel_matches_serial(self):
+        # Test if the parallel conversion writes the same file as the serial one
+        write_genbank(parse_file(self.test_fasta), self.genbank_file)
+        count = write_genbank_parallel(self.test_fasta, self.parallel_genbank_file, workers=2)
+        self.assertEqual(count, 20)
+        with open(self.genbank_file, 'r') as serial, open(self.parallel_genbank_file, 'r') as parallel:
+            self.assertEqual(serial.read(), parallel.read())
+
+
     
 class TestPrintFastaStatistics(unittest.TestCase):
     def setUp(self):
@@ -96,6 +133,33 @@ class TestPrintFastaStatistics(unittest.TestCase):
         self.assertEqual(statisticsDictionary["median_read_length"], 12)
         self.assertEqual(statisticsDictionary["min_read_length"], 3)
         self.assertEqual(statisticsDictionary["total_reads"], 3)
+    def test_fasta_statistics_parsed_records(self):
+        # Test if the statistics can be calculated from already parsed records
+        statisticsDictionary = print_fasta_statistics(list(parse_file(self.testing_fasta)))
+        self.assertEqual(statisticsDictionary["max_read_length"], 21)
+        self.assertEqual(statisticsDictionary["median_read_length"], 12)
+        self.assertEqual(statisticsDictionary["min_read_length"], 3)
+        self.assertEqual(statisticsDictionary["total_reads"], 3)
+    def test_fasta_statistics_without_median(self):
+        # Test if the median is skipped when it is not requested
+        statisticsDictionary = print_fasta_statistics(self.testing_fasta, median=False)
+        self.assertEqual(statisticsDictionary["mean_read_length"], 12)
+        self.assertIsNone(statisticsDictionary["median_read_length"])
+        self.assertEqual(statisticsDictionary["total_reads"], 3)
+    def test_middle_value(self):
+        # Test the median for both an odd and an even number of reads
+        self.assertEqual(middle_value(np.array([21, 3, 12])), 12)
+        self.assertEqual(middle_value(np.array([21, 3, 12, 4])), 8)
+    def test_fasta_statistics_wrapped_lines(self):
+        # Test if sequences split over several lines are counted correctly
+        with open(self.testing_fasta, 'w') as file:
+            file.write(">seq1\nATGC\nATGC\r\nAT\n") #10bp
+            file.write(">seq2\n") #0bp
+            file.write(">seq3\nATG\n\n") #3bp
+        statisticsDictionary = print_fasta_statistics(self.testing_fasta)
+        self.assertEqual(statisticsDictionary["max_read_length"], 10)
+        self.assertEqual(statisticsDictionary["min_read_length"], 0)
+        self.assertEqual(statisticsDictionary["total_reads"], 3)
 
 class TestTestFastaFormat(unittest.TestCase):
     def setUp(self):
@@ -115,8 +179,23 @@ class TestTestFastaFormat(unittest.TestCase):
     def testIsFasta(self):
         self.assertEqual(is_fasta(self.test_fasta), True)
         self.assertEqual(is_fasta(self.not_fasta), False)
+        self.assertEqual(is_fasta("test.fa"), True)
+        self.assertEqual(is_fasta("test.fna"), True)
+        self.assertEqual(is_fasta("TEST.FASTA"), True)
+        self.assertEqual(is_fasta("test.fasta.gb"), False)
         self.assertEqual(has_valid_header(self.test_fasta), True)
         self.assertEqual(has_valid_header(self.not_fasta), False)
+    def testHeaderWithoutLineBreak(self):
+        # Test if a header on a single very long line is still recognised
+        with open(self.test_fasta, 'w') as file:
+            file.write(">" + "A" * 100000)
+        self.assertEqual(has_valid_header(self.test_fasta), True)
+    def testHeaderCheckFollowsFileChanges(self):
+        # Test if a cached header check is refreshed after the file is rewritten
+        self.assertEqual(has_valid_header(self.not_fasta), False)
+        with open(self.not_fasta, 'w') as file:
+            file.write(">seq1\nAGGGAGCTAGCTACGATCGAA\n")
+        self.assertEqual(has_valid_header(self.not_fasta), True)
 
 # Run the tests
 if __name__ == '__main__':